@@ -0,0 +1,82 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+# distutils: extra_compile_args = -fopenmp -O3 -march=native
+# distutils: extra_link_args = -fopenmp
+"""
+Cython/OpenMP kernel for S_p = sum_{n=0}^{p-1} exp(2*pi*i*Q(n)/p).
+
+Same blocked finite-difference scheme as expsum_numba in
+compute_exponential_sums.py: the residues are cut into blocks, each
+block seeds the forward differences of Q at its first n and steps
+Q(n) -> Q(n+1) with 46 additions mod p.  The 47 seed values per block
+come from square-and-multiply here, not the generated Horner form.
+
+Build in place with:
+    cythonize -i scripts/_expsum.pyx
+
+Author: Ruqing Chen
+Repository: https://github.com/Ruqing1963/Q47-ExponentialSums
+"""
+
+cimport openmp
+from cython.parallel cimport parallel, prange
+from libc.math cimport M_PI, cos, sin
+from libc.stdlib cimport free, malloc
+
+cdef enum:
+    DEGREE = 46
+    BLOCK = 4096
+
+
+cdef inline long long _titan_mod(long long n, long long p) noexcept nogil:
+    """Q(n) mod p for a single integer n >= 0."""
+    cdef long long a = 1, b = 1
+    cdef long long x = n % p, y = (n - 1 + p) % p
+    cdef int e = 47
+    while e:
+        if e & 1:
+            a = a * x % p
+            b = b * y % p
+        x = x * x % p
+        y = y * y % p
+        e >>= 1
+    return (a - b + p) % p
+
+
+def expsum(long long p):
+    """Compute S_p with OpenMP threads over blocks of residues."""
+    cdef double c = 2.0 * M_PI / p
+    cdef Py_ssize_t n_blocks = (p + BLOCK - 1) // BLOCK
+    cdef Py_ssize_t b
+    cdef long long start, stop, n
+    cdef int j, k
+    cdef long long *d = NULL
+    cdef double th
+    cdef double S_re = 0.0, S_im = 0.0
+
+    with nogil, parallel():
+        d = <long long *> malloc((DEGREE + 1) * sizeof(long long))
+        for b in prange(n_blocks, schedule='static'):
+            start = b * BLOCK
+            stop = start + BLOCK
+            if stop > p:
+                stop = p
+            for j in range(DEGREE + 1):
+                d[j] = _titan_mod(start + j, p)
+            for k in range(1, DEGREE + 1):
+                for j in range(DEGREE, k - 1, -1):
+                    d[j] = (d[j] - d[j - 1] + p) % p
+            for n in range(start, stop):
+                th = c * d[0]
+                S_re += cos(th)
+                S_im += sin(th)
+                for k in range(DEGREE):
+                    d[k] = d[k] + d[k + 1]
+                    if d[k] >= p:
+                        d[k] = d[k] - p
+        free(d)
+    return complex(S_re, S_im)
+
+
+def set_num_threads(int n):
+    """Set the OpenMP thread count used by expsum."""
+    openmp.omp_set_num_threads(n)
@@ -12,94 +12,488 @@ Author: Ruqing Chen
 Repository: https://github.com/Ruqing1963/Q47-ExponentialSums
 """
 
-import cmath
-import csv
+import argparse
+import importlib.util
 import math
 import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+try:
+    from numba import njit, parallel_chunksize, prange, set_num_threads
+    HAVE_NUMBA = True
+except ImportError:  # optional: fall back to the NumPy path
+    HAVE_NUMBA = False
+
+try:
+    import _expsum  # cythonize -i scripts/_expsum.pyx
+    HAVE_CYTHON = True
+except ImportError:  # optional: extension not built
+    HAVE_CYTHON = False
 
 
 MAX_PRIME = 50000
+DEGREE = 46          # deg Q(n); the n^47 terms cancel
+BLOCK = 4096         # residues per parallel block in the Numba kernel
+OUTLIER = 283        # reported separately in the summary statistics
+SMALL_PRIME = 1000   # primes below this are summed together in one batch
+CUDA_THREADS = 256   # threads per block (one block per prime) in the GPU kernel
+
+# One thread block per prime: each thread sums every CUDA_THREADS-th
+# residue, then the block reduces in shared memory.  out holds Re/Im
+# pairs, so it can be viewed directly as complex128.
+CUDA_SOURCE = r"""
+__device__ long long pow47(long long x, long long p)
+{
+    long long x2 = x * x % p;
+    long long x4 = x2 * x2 % p;
+    long long x8 = x4 * x4 % p;
+    long long x16 = x8 * x8 % p;
+    long long x32 = x16 * x16 % p;
+    return x32 * x8 % p * x4 % p * x2 % p * x % p;
+}
+
+extern "C" __global__ void expsum(const long long *primes, double *out)
+{
+    __shared__ double s_re[CUDA_THREADS];
+    __shared__ double s_im[CUDA_THREADS];
+    const long long p = primes[blockIdx.x];
+    double re = 0.0, im = 0.0, s, c;
+    for (long long n = threadIdx.x; n < p; n += blockDim.x) {
+        long long v = (pow47(n, p) - pow47((n + p - 1) % p, p) + p) % p;
+        sincospi(2.0 * v / p, &s, &c);
+        re += c;
+        im += s;
+    }
+    s_re[threadIdx.x] = re;
+    s_im[threadIdx.x] = im;
+    __syncthreads();
+    for (int k = blockDim.x / 2; k > 0; k >>= 1) {
+        if (threadIdx.x < k) {
+            s_re[threadIdx.x] += s_re[threadIdx.x + k];
+            s_im[threadIdx.x] += s_im[threadIdx.x + k];
+        }
+        __syncthreads();
+    }
+    if (threadIdx.x == 0) {
+        out[2 * blockIdx.x] = s_re[0];
+        out[2 * blockIdx.x + 1] = s_im[0];
+    }
+}
+"""
 
 
-def sieve_primes(n: int) -> list:
+def sieve_primes(n: int) -> np.ndarray:
     """Sieve of Eratosthenes up to n."""
-    is_prime = [True] * (n + 1)
-    is_prime[0] = is_prime[1] = False
+    is_prime = np.ones(n + 1, dtype=np.uint8)
+    is_prime[:2] = 0
     for i in range(2, int(n**0.5) + 1):
         if is_prime[i]:
-            for j in range(i * i, n + 1, i):
-                is_prime[j] = False
-    return [i for i in range(2, n + 1) if is_prime[i]]
+            is_prime[i * i::i] = 0
+    return np.flatnonzero(is_prime)
+
+
+def effective_primes(n: int, m: int = 47) -> np.ndarray:
+    """Primes p ≤ n with p ≡ 1 (mod m), for m prime.
+
+    Only the candidates 1 + m*k are sieved.  A prime q ≠ m up to sqrt(n)
+    divides 1 + m*k exactly when k ≡ -m^{-1} (mod q), so its multiples
+    form one stride-q slice of the candidate array.
+    """
+    cands = np.arange(1, n + 1, m)
+    is_prime = np.ones(len(cands), dtype=np.bool_)
+    is_prime[0] = False
+    for q in sieve_primes(math.isqrt(n)).tolist():
+        if q == m:
+            continue
+        k = -pow(m, -1, q) % q
+        if 1 + m * k == q:
+            k += q
+        is_prime[k::q] = False
+    return cands[is_prime]
+
+
+def primitive_root(p: int) -> int:
+    """Smallest primitive root modulo an odd prime p."""
+    m, factors, q = p - 1, [], 2
+    while q * q <= m:
+        if m % q == 0:
+            factors.append(q)
+            while m % q == 0:
+                m //= q
+        q += 1
+    if m > 1:
+        factors.append(m)
+    for g in range(2, p):
+        if all(pow(g, (p - 1) // q, p) != 1 for q in factors):
+            return g
+
+
+def power_table(p: int) -> np.ndarray:
+    """Table P[x] = x^47 mod p for x = 0..p-1, by walking F_p^*.
+
+    With g a primitive root, G[k] = g^k runs once over F_p^* and
+    (g^k)^47 = g^(47k mod p-1), so P[G[k]] = G[47k mod p-1].  G is filled
+    by doubling, G[L:2L] = G[:L] * g^L, one multiplication per entry
+    instead of nine for an addition chain.
+    """
+    g = primitive_root(p)
+    G = np.empty(p - 1, dtype=np.int64)
+    G[0] = 1
+    L = 1
+    while L < p - 1:
+        step = min(L, p - 1 - L)
+        G[L:L + step] = G[:step] * pow(g, L, p) % p
+        L += step
+    P = np.empty(p, dtype=np.int64)
+    P[0] = 0
+    P[G] = G[47 * np.arange(p - 1) % (p - 1)]
+    return P
+
+
+def roots_of_unity(p: int, dtype=np.complex128) -> np.ndarray:
+    """Table W[k] = exp(2*pi*i*k/p) for k = 0..p-1.
+
+    Only k <= p/2 is evaluated; the rest follows from W[p-k] = conj(W[k]).
+    The angles are formed in double precision, then cast to the real type
+    of dtype so cos/sin run at that width.
+    """
+    theta = ((2 * np.pi / p) * np.arange(p // 2 + 1)).astype(
+        np.finfo(dtype).dtype)
+    half = np.empty(len(theta), dtype=dtype)
+    half.real = np.cos(theta)
+    half.imag = np.sin(theta)
+    return np.concatenate([half, half[1:(p + 1) // 2][::-1].conj()])
+
+
+def titan_residues(p: int) -> np.ndarray:
+    """Table of Q(n) mod p for n = 0..p-1.
+
+    The power map P[x] = x^47 mod p is tabulated once and Q is read off
+    as its backward difference, Q(n) = P[n] - P[n-1], with P[-1] = P[p-1]
+    since -1 ≡ p-1 (mod p).
+    """
+    P = power_table(p)
+    return (P - np.roll(P, 1)) % p
+
+
+def expsum_numpy(p: int, dtype=np.complex128) -> complex:
+    """Compute S_p with NumPy array arithmetic.
+
+    dtype sets the precision of the roots-of-unity table and the sum.
+    """
+    W = roots_of_unity(p, dtype)
+    return complex(W.take(titan_residues(p)).sum())
+
+
+def pow47(x: np.ndarray, p) -> np.ndarray:
+    """Elementwise x^47 mod p along the addition chain 47 = 32+8+4+2+1.
+
+    p may be a scalar or an array broadcasting against x.  Entries of x
+    must lie in [0, p); with p < 2^31 every product fits in int64.
+    """
+    x2 = x * x % p
+    x4 = x2 * x2 % p
+    x8 = x4 * x4 % p
+    x16 = x8 * x8 % p
+    x32 = x16 * x16 % p
+    return x32 * x8 % p * x4 % p * x2 % p * x % p
+
+
+def expsum_batch(primes: list, dtype=np.complex128) -> np.ndarray:
+    """Compute S_p for several primes with one set of array operations.
+
+    The residues of all primes are laid end to end in one buffer, each
+    entry carrying its own modulus, and the per-prime sums are taken with
+    np.add.reduceat.  Meant for small primes, where per-call overhead
+    outweighs the arithmetic.  cos/sin run at the real width of dtype.
+    """
+    ps = np.asarray(primes, dtype=np.int64)
+    starts = np.concatenate([[0], np.cumsum(ps)[:-1]])
+    mod = np.repeat(ps, ps)
+    idx = np.arange(mod.size)
+    P = pow47(idx - np.repeat(starts, ps), mod)
+    # Q(n) = P[n] - P[n-1]; n = 0 wraps to n = p-1 within each segment.
+    prev = idx - 1
+    prev[starts] = starts + ps - 1
+    theta = ((2 * np.pi / mod) * ((P - P[prev]) % mod)).astype(
+        np.finfo(dtype).dtype)
+    return (np.add.reduceat(np.cos(theta), starts)
+            + 1j * np.add.reduceat(np.sin(theta), starts))
 
 
-def compute_expsum(p: int) -> complex:
-    """Compute S_p = sum_{n=0}^{p-1} exp(2*pi*i*Q(n)/p)."""
-    S = 0j
-    for n in range(p):
-        val = (pow(n, 47, p) - pow((n - 1) % p, 47, p)) % p
-        theta = 2 * math.pi * val / p
-        S += cmath.exp(1j * theta)
-    return S
+def titan_source(name: str = "titan_mod") -> str:
+    """Python source for name(n, p) = Q(n) mod p in straight-line Horner form.
+
+    Q(n) = sum_{k=0}^{46} (-1)^k C(47, k) n^k, the n^47 terms cancelling,
+    so the coefficients are baked in as literals and each step is one
+    multiply-add mod p.  Needs p < 2^31 to stay inside int64.
+    """
+    coeffs = [(-1) ** k * math.comb(47, k) for k in range(DEGREE + 1)]
+    lines = [f"def {name}(n, p):",
+             "    x = n % p",
+             f"    acc = {coeffs[DEGREE]} % p"]
+    for c in reversed(coeffs[:DEGREE]):
+        sign = '-' if c < 0 else '+'
+        lines.append(f"    acc = (acc * x {sign} {abs(c)}) % p")
+    lines.append("    return acc")
+    return "\n".join(lines) + "\n"
+
+
+if HAVE_NUMBA:
+    # Generated source has no file to cache against, so no cache=True.
+    _ns = {}
+    exec(titan_source("_titan_mod"), _ns)
+    _titan_mod = njit(_ns["_titan_mod"])
+
+    @njit(fastmath=True, cache=True)
+    def _block_sum(p, start, stop):
+        """Sum of exp(2*pi*i*Q(n)/p) over start <= n < stop.
+
+        Seeds the forward differences Q(start), ΔQ(start), ...,
+        Δ^46 Q(start) and then steps Q(n) -> Q(n+1) with 46 additions
+        mod p, so no exponentiation is done per term.
+        """
+        c = 2.0 * math.pi / p
+        d = np.empty(DEGREE + 1, dtype=np.int64)
+        for j in range(DEGREE + 1):
+            d[j] = _titan_mod(start + j, p)
+        for k in range(1, DEGREE + 1):
+            for j in range(DEGREE, k - 1, -1):
+                d[j] = (d[j] - d[j - 1]) % p
+        S_re = 0.0
+        S_im = 0.0
+        for n in range(start, stop):
+            th = c * d[0]
+            S_re += math.cos(th)
+            S_im += math.sin(th)
+            for k in range(DEGREE):
+                d[k] += d[k + 1]
+                if d[k] >= p:
+                    d[k] -= p
+        return S_re, S_im
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def expsum_numba(p):
+        """Compute S_p with a compiled finite-difference kernel.
+
+        The recurrence is sequential, so the residues are split into
+        blocks of BLOCK consecutive n, one per parallel iteration, each
+        seeding its own differences.
+        """
+        n_blocks = (p + BLOCK - 1) // BLOCK
+        S_re = 0.0
+        S_im = 0.0
+        for b in prange(n_blocks):
+            start = b * BLOCK
+            re, im = _block_sum(p, start, min(start + BLOCK, p))
+            S_re += re
+            S_im += im
+        return complex(S_re, S_im)
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _expsum_all(primes, re_out, im_out):
+        for k in prange(primes.shape[0]):
+            re_out[k], im_out[k] = _block_sum(primes[k], 0, primes[k])
+
+    def expsum_all_numba(primes: list) -> np.ndarray:
+        """Compute S_p for all primes in one compiled call.
+
+        Parallel over primes rather than residues.  The cost per prime
+        grows with p, so, as in _sweep_local, the kernel is run largest
+        first in chunks of one prime and the results are scattered back
+        to the input order.
+        """
+        primes = np.asarray(primes, dtype=np.int64)
+        order = np.argsort(primes)[::-1]
+        re_out = np.empty(len(primes))
+        im_out = np.empty(len(primes))
+        with parallel_chunksize(1):
+            _expsum_all(primes[order], re_out, im_out)
+        S = np.empty(len(primes), dtype=np.complex128)
+        S[order] = re_out + 1j * im_out
+        return S
+
+
+def compute_expsum(p: int, dtype=np.complex128) -> complex:
+    """Compute S_p = sum_{n=0}^{p-1} exp(2*pi*i*Q(n)/p).
+
+    The compiled kernels work in double precision; any other dtype takes
+    the NumPy path.
+    """
+    if np.dtype(dtype) != np.complex128:
+        return expsum_numpy(p, dtype)
+    if HAVE_CYTHON:
+        return _expsum.expsum(p)
+    if HAVE_NUMBA:
+        return expsum_numba(p)
+    return expsum_numpy(p)
+
+
+def expsum_cuda(primes: list) -> np.ndarray:
+    """Compute S_p for all primes in a single CUDA launch (requires cupy)."""
+    import cupy as cp
+
+    kernel = cp.RawKernel(CUDA_SOURCE, 'expsum',
+                          options=(f'-DCUDA_THREADS={CUDA_THREADS}',))
+    d_primes = cp.asarray(primes, dtype=cp.int64)
+    d_out = cp.empty(len(primes), dtype=cp.complex128)
+    kernel((len(primes),), (CUDA_THREADS,), (d_primes, d_out))
+    return cp.asnumpy(d_out)
+
+
+def _init_worker():
+    """Pool initializer: one thread per process, the pool is the parallelism."""
+    if HAVE_CYTHON:
+        _expsum.set_num_threads(1)
+    if HAVE_NUMBA:
+        set_num_threads(1)
+
+
+def _sweep_local(eff_primes: list, dtype=np.complex128):
+    """Yield (p, S_p) on this machine, in a two-tier schedule.
+
+    Primes below SMALL_PRIME go through expsum_batch in one call.  The
+    rest go to a process pool one task per prime, largest first, so the
+    few long sums start early instead of queueing behind short ones.
+    """
+    small = [p for p in eff_primes if p < SMALL_PRIME]
+    large = sorted((p for p in eff_primes if p >= SMALL_PRIME),
+                   reverse=True)
+    if small:
+        yield from zip(small, expsum_batch(small, dtype).tolist())
+    with ProcessPoolExecutor(initializer=_init_worker) as pool:
+        yield from zip(large, pool.map(partial(compute_expsum, dtype=dtype),
+                                       large, chunksize=1))
+
+
+def _sweep_mpi(comm, eff_primes: list, dtype=np.complex128):
+    """Compute S_p across MPI ranks; the full array lands on rank 0.
+
+    Primes are dealt round-robin so every rank gets a similar mix of
+    small and large p.  Each rank fills its own slots of a zeroed
+    complex buffer and the buffers are summed onto rank 0, which gets
+    the array of all S_p; the other ranks get None.
+    """
+    from mpi4py import MPI
+
+    rank, size = comm.Get_rank(), comm.Get_size()
+    local = np.zeros(len(eff_primes), dtype=np.complex128)
+    for i in range(rank, len(eff_primes), size):
+        local[i] = compute_expsum(eff_primes[i], dtype)
+    total = np.empty_like(local) if rank == 0 else None
+    comm.Reduce(local, total, op=MPI.SUM, root=0)
+    return total
 
 
 def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--mpi", action="store_true",
+                      help="distribute primes over MPI ranks "
+                           "(run under mpiexec; requires mpi4py)")
+    mode.add_argument("--gpu", action="store_true",
+                      help="compute all S_p on a CUDA GPU (requires cupy)")
+    parser.add_argument("--float32", action="store_true",
+                        help="sum in single precision on the NumPy path "
+                             "(agrees to ~1e-6 in |S_p|/sqrt(p), but can "
+                             "change the sixth decimal in the CSV)")
+    args = parser.parse_args()
+    if args.gpu and args.float32:
+        parser.error("--float32 is not supported with --gpu")
+    dtype = np.complex64 if args.float32 else np.complex128
+    if args.gpu and importlib.util.find_spec("cupy") is None:
+        parser.error("--gpu requires cupy")
+
+    comm = None
+    if args.mpi:
+        from mpi4py import MPI
+        comm = MPI.COMM_WORLD
+
+    eff_primes = effective_primes(MAX_PRIME).tolist()
+    if comm is not None and comm.Get_rank() > 0:
+        _sweep_mpi(comm, eff_primes, dtype)
+        return
+
     print("=" * 65)
     print("  Exponential Sums for Q(n) = n^47 - (n-1)^47")
     print("  Primes p ≡ 1 (mod 47), p ≤", MAX_PRIME)
     print("=" * 65)
     print()
 
-    primes = sieve_primes(MAX_PRIME)
-    eff_primes = [p for p in primes if (p - 1) % 47 == 0]
     print(f"Effective primes: N = {len(eff_primes)}")
     print(f"Range: {eff_primes[0]} to {eff_primes[-1]}")
     print()
 
-    results = []
-    for idx, p in enumerate(eff_primes):
-        S = compute_expsum(p)
-        sqrtp = math.sqrt(p)
-        normed = S / sqrtp
-        results.append({
-            'p': p,
-            're': normed.real,
-            'im': normed.imag,
-            'mag': abs(normed)
-        })
+    # Primes are independent; results may arrive out of order.  The summary
+    # statistics are accumulated in the same pass, with and without the
+    # outlier.
+    N = len(eff_primes)
+    p_arr = np.empty(N, dtype=np.int64)
+    re_arr = np.empty(N)
+    im_arr = np.empty(N)
+    mag_arr = np.empty(N)
+    sum_mag = sum_mag_ex = 0.0
+    max_mag = max_mag_ex = -1.0
+    max_p = 0
+    n_ex = 0
+    if comm is not None:
+        results = zip(eff_primes,
+                      _sweep_mpi(comm, eff_primes, dtype).tolist())
+    elif args.gpu:
+        results = zip(eff_primes, expsum_cuda(eff_primes).tolist())
+    elif HAVE_NUMBA and not args.float32:
+        results = zip(eff_primes, expsum_all_numba(eff_primes).tolist())
+    else:
+        results = _sweep_local(eff_primes, dtype)
+    for idx, (p, S) in enumerate(results):
+        normed = S / math.sqrt(p)
+        mag = abs(normed)
+        p_arr[idx] = p
+        re_arr[idx] = normed.real
+        im_arr[idx] = normed.imag
+        mag_arr[idx] = mag
+        sum_mag += mag
+        if mag > max_mag:
+            max_mag, max_p = mag, p
+        if p != OUTLIER:
+            sum_mag_ex += mag
+            n_ex += 1
+            max_mag_ex = max(max_mag_ex, mag)
         if (idx + 1) % 20 == 0 or idx == 0:
-            print(f"  [{idx+1:>3}/{len(eff_primes)}] p={p:>5}, "
-                  f"|S_p|/sqrt(p) = {abs(normed):.4f}")
-
-    mags = [r['mag'] for r in results]
-    max_idx = mags.index(max(mags))
+            print(f"  [{idx+1:>3}/{N}] p={p:>5}, "
+                  f"|S_p|/sqrt(p) = {mag:.4f}")
+    order = np.argsort(p_arr)
+    p_arr, re_arr, im_arr, mag_arr = (
+        a[order] for a in (p_arr, re_arr, im_arr, mag_arr))
+    mean = sum_mag / N
 
     print()
     print(f"{'Statistic':<30} {'Value':>10}")
     print("-" * 42)
-    print(f"{'N':.<30} {len(results):>10}")
-    print(f"{'Mean |S_p|/sqrt(p)':.<30} {sum(mags)/len(mags):>10.4f}")
-    print(f"{'Max  |S_p|/sqrt(p)':.<30} {max(mags):>10.4f}")
-    print(f"{'Max at p =':.<30} {results[max_idx]['p']:>10}")
+    print(f"{'N':.<30} {N:>10}")
+    print(f"{'Mean |S_p|/sqrt(p)':.<30} {mean:>10.4f}")
+    print(f"{'Max  |S_p|/sqrt(p)':.<30} {max_mag:>10.4f}")
+    print(f"{'Max at p =':.<30} {max_p:>10}")
 
-    mags_ex = [r['mag'] for r in results if r['p'] != 283]
-    print(f"{'Mean (excl. p=283)':.<30} {sum(mags_ex)/len(mags_ex):>10.4f}")
-    print(f"{'Max  (excl. p=283)':.<30} {max(mags_ex):>10.4f}")
+    print(f"{f'Mean (excl. p={OUTLIER})':.<30} {sum_mag_ex/n_ex:>10.4f}")
+    print(f"{f'Max  (excl. p={OUTLIER})':.<30} {max_mag_ex:>10.4f}")
 
     print()
     print("Reference predictions:")
     print(f"  Gaussian RW (45 vectors):  ≈ 5.97")
     print(f"  USp(44):                   ≈ 3.74")
-    print(f"  Observed:                  ≈ {sum(mags)/len(mags):.2f}")
+    print(f"  Observed:                  ≈ {mean:.2f}")
 
-    # Save CSV
+    # Save CSV (CRLF rows, as csv.writer produced)
     os.makedirs("data", exist_ok=True)
-    with open("data/exponential_sums.csv", "w", newline="") as f:
-        w = csv.writer(f)
-        w.writerow(["prime_p", "Re_Sp_over_sqrtp",
-                     "Im_Sp_over_sqrtp", "magnitude"])
-        for r in results:
-            w.writerow([r['p'], f"{r['re']:.6f}",
-                        f"{r['im']:.6f}", f"{r['mag']:.6f}"])
+    np.savetxt("data/exponential_sums.csv",
+               np.column_stack([p_arr, re_arr, im_arr, mag_arr]),
+               fmt=['%d', '%.6f', '%.6f', '%.6f'], delimiter=',',
+               newline='\r\n', comments='',
+               header="prime_p,Re_Sp_over_sqrtp,Im_Sp_over_sqrtp,magnitude")
     print("\n  Saved to data/exponential_sums.csv")
     print("  [DONE]")
 
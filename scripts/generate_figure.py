@@ -18,35 +18,39 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import numpy as np
 
+# Reference curves shared by the panels, computed once at import.
+GAUSS_X = np.linspace(-10, 10, 300)
+GAUSS_PDF = (1/np.sqrt(2*np.pi))*np.exp(-GAUSS_X**2/2)
+CIRCLE_T = np.linspace(0, 2*np.pi, 200)
+CIRCLE_X, CIRCLE_Y = np.cos(CIRCLE_T), np.sin(CIRCLE_T)
+
+# Above this many points the panel (c) scatter is embedded as a bitmap;
+# below it per-point vector markers are smaller and stay sharp.
+RASTERIZE_ABOVE = 5000
+
 
 def load_data(path="data/exponential_sums.csv"):
     """Load exponential sum data from CSV."""
-    re_vals, im_vals, mag_vals, p_vals = [], [], [], []
     with open(path) as f:
-        reader = csv.reader(f)
-        for row in reader:
-            if row[0].startswith('#') or row[0] == 'prime_p':
-                continue
-            p_vals.append(int(row[0]))
-            re_vals.append(float(row[1]))
-            im_vals.append(float(row[2]))
-            mag_vals.append(float(row[3]))
-    return (np.array(re_vals), np.array(im_vals),
-            np.array(mag_vals), np.array(p_vals))
+        rows = [row for row in csv.reader(f)
+                if not (row[0].startswith('#') or row[0] == 'prime_p')]
+    # One conversion for the whole table; reshape keeps (0, 4) when empty.
+    data = np.array(rows, dtype=float).reshape(-1, 4)
+    return (data[:, 1], data[:, 2], data[:, 3],
+            data[:, 0].astype(np.int64))
 
 
 def main():
     re_vals, im_vals, mag_vals, p_vals = load_data()
 
-    fig, axes = plt.subplots(2, 2, figsize=(12, 10))
+    fig, axes = plt.subplots(2, 2, figsize=(12, 10), dpi=300)
 
     # ── Panel (a): Real Part ──
     ax = axes[0, 0]
     ax.hist(re_vals, bins=25, density=True, color='#5B9BD5',
             edgecolor='white', alpha=0.85,
             label=r'$\mathrm{Re}(S_p)/\sqrt{p}$')
-    x = np.linspace(-10, 10, 300)
-    ax.plot(x, (1/np.sqrt(2*np.pi))*np.exp(-x**2/2), 'r--', lw=1.5,
+    ax.plot(GAUSS_X, GAUSS_PDF, 'r--', lw=1.5,
             label=r'$\mathcal{N}(0,1)$')
     ax.set_xlim(-10, 10)
     ax.set_xlabel(r'$\mathrm{Re}(S_p)/\sqrt{p}$', fontsize=11)
@@ -60,7 +64,7 @@ def main():
     ax.hist(im_vals, bins=25, density=True, color='#70AD47',
             edgecolor='white', alpha=0.85,
             label=r'$\mathrm{Im}(S_p)/\sqrt{p}$')
-    ax.plot(x, (1/np.sqrt(2*np.pi))*np.exp(-x**2/2), 'r--', lw=1.5,
+    ax.plot(GAUSS_X, GAUSS_PDF, 'r--', lw=1.5,
             label=r'$\mathcal{N}(0,1)$')
     ax.set_xlim(-5, 5)
     ax.set_xlabel(r'$\mathrm{Im}(S_p)/\sqrt{p}$', fontsize=11)
@@ -74,12 +78,11 @@ def main():
     mask = p_vals != 283
     sc = ax.scatter(re_vals[mask], im_vals[mask], c=p_vals[mask],
                     cmap='viridis', s=25, alpha=0.8,
-                    edgecolors='k', linewidths=0.3)
+                    edgecolors='k', linewidths=0.3,
+                    rasterized=mask.sum() > RASTERIZE_ABOVE)
     plt.colorbar(sc, ax=ax, label='Prime $p$')
     for r in [2, 4, 6, 8]:
-        theta = np.linspace(0, 2*np.pi, 200)
-        ax.plot(r*np.cos(theta), r*np.sin(theta),
-                'k--', alpha=0.2, lw=0.8)
+        ax.plot(r*CIRCLE_X, r*CIRCLE_Y, 'k--', alpha=0.2, lw=0.8)
     # p=283 outlier: red star with white-bg label
     idx283 = np.where(p_vals == 283)[0]
     if len(idx283) > 0:
@@ -121,10 +124,10 @@ def main():
     ax.set_xlim(0, 10)
     ax.grid(True, alpha=0.2)
 
-    plt.tight_layout(pad=1.5)
+    fig.tight_layout(pad=1.5)
     os.makedirs("figures", exist_ok=True)
-    plt.savefig("figures/expsum_figure.pdf", dpi=300,
-                bbox_inches='tight')
+    fig.savefig("figures/expsum_figure.pdf", bbox_inches='tight')
+    plt.close(fig)
     print("Figure saved to figures/expsum_figure.pdf")
 
 